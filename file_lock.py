@@ -0,0 +1,55 @@
+import os
+import time
+import logging
+from pathlib import Path
+
+STALE_LOCK_AGE = 60  # secs without refresh before a lock is considered abandoned
+
+log = logging.getLogger(__name__)
+
+
+class FileLock:
+    def __init__(self, lock_file, logger=log):
+        self.lock_file = Path(lock_file)
+        self.fd = None
+        self.logger = logger
+    
+    def acquire(self, timeout=0):
+        # OS-level exclusive lock with stale lock detection (STALE_LOCK_AGE timeout)
+        start = time.time()
+        while True:
+            try:
+                self.fd = os.open(str(self.lock_file), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(self.fd, str(os.getpid()).encode())
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - self.lock_file.stat().st_mtime > STALE_LOCK_AGE:
+                        self.logger.warning("Removing stale lock file")
+                        self.lock_file.unlink()
+                        continue
+                except:
+                    pass
+                
+                if timeout == 0 or (time.time() - start) >= timeout:
+                    return False
+                time.sleep(0.1)
+    
+    def refresh(self):
+        # long running holders bump mtime so the lock isn't taken for stale
+        try:
+            os.utime(self.lock_file)
+        except Exception as e:
+            self.logger.error(f"Failed to refresh lock file: {e}")
+
+    def release(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except Exception as e:
+                self.logger.error(f"Failed to close lock file descriptor: {e}")
+            self.fd = None
+        try:
+            self.lock_file.unlink()
+        except Exception as e:
+            self.logger.error(f"Failed to delete lock file: {e}")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+import sys
+from pathlib import Path
+import logging
+import json
+import io
+import os
+import time
+
+plugindir = Path(__file__).parent.resolve()
+if str(plugindir) not in sys.path:
+    sys.path.insert(0, str(plugindir))
+lib_path = plugindir / 'lib'
+if str(lib_path) not in sys.path:
+    sys.path.insert(0, str(lib_path))
+
+import gkeepapi
+from logging_setup import setup_queued_logging, file_handler
+from file_lock import FileLock
+
+ICON_CACHE_DIR = plugindir / "icon_cache"
+ICON_LOCK_FILE = plugindir / "icon_worker.lock"
+FAILED_ICONS_FILE = ICON_CACHE_DIR / "failed.json"
+ICON_CACHE_MAX_BYTES = 5 * 1024 * 1024
+ICON_SIZE = 64
+
+# google keep light theme palette
+NOTE_COLORS = {
+    'DEFAULT': '#ffffff',
+    'RED': '#f28b82',
+    'ORANGE': '#fbbc04',
+    'YELLOW': '#fff475',
+    'GREEN': '#ccff90',
+    'TEAL': '#a7ffeb',
+    'BLUE': '#cbf0f8',
+    'CERULEAN': '#aecbfa',
+    'PURPLE': '#d7aefb',
+    'PINK': '#fdcfe8',
+    'BROWN': '#e6c9a8',
+    'GRAY': '#e8eaed',
+}
+INK_COLOR = '#5f6368'
+
+logger = logging.getLogger('icon_worker')
+setup_queued_logging(logger, file_handler(plugindir / "icon_worker.log"))
+
+try:
+    from PIL import Image, ImageDraw, ImageOps
+    ICONS_ENABLED = True
+except ImportError:
+    ICONS_ENABLED = False
+    logger.warning("Pillow not installed, note icons disabled")
+
+
+def load_requests():
+    # merge every pending request file, the plugin writes one per listing
+    specs = {}
+    for request_file in sorted(ICON_CACHE_DIR.glob('request-*.json')):
+        try:
+            with open(request_file, 'r', encoding='utf-8') as f:
+                for spec in json.load(f):
+                    specs[spec['key']] = spec
+        except Exception as e:
+            logger.error(f"Failed to load icon request {request_file.name}: {e}")
+        try:
+            request_file.unlink()
+        except Exception:
+            pass
+    return specs
+
+
+def load_failed():
+    try:
+        if FAILED_ICONS_FILE.exists():
+            with open(FAILED_ICONS_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Failed to load failed icons: {e}")
+    return {}
+
+
+def save_failed(failed):
+    # forget entries whose icon was evicted
+    failed = {key: ts for key, ts in failed.items() if (ICON_CACHE_DIR / f"{key}.png").exists()}
+    tmp_file = FAILED_ICONS_FILE.with_suffix('.tmp')
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(failed, f)
+        os.replace(tmp_file, FAILED_ICONS_FILE)
+    except Exception as e:
+        logger.error(f"Failed to save failed icons: {e}")
+
+
+def fetch_thumbnail(keep, spec):
+    note = keep.get(spec['note_id'])
+    if note is None:
+        logger.warning(f"Note {spec['note_id']} not found, rendering without image")
+        return None
+
+    blob = next((b for b in note.images if b.server_id == spec['image']), None)
+    if blob is None:
+        return None
+
+    import requests
+    url = keep.getMediaLink(blob)
+    response = requests.get(url, timeout=15)
+    response.raise_for_status()
+
+    image = Image.open(io.BytesIO(response.content))
+    # let the jpeg decoder downscale while decoding, much cheaper for big photos
+    image.draft('RGB', (ICON_SIZE * 2, ICON_SIZE * 2))
+    return ImageOps.fit(image.convert('RGB'), (ICON_SIZE, ICON_SIZE), Image.LANCZOS)
+
+
+def render_icon(spec, thumbnail=None):
+    size = ICON_SIZE
+    color = NOTE_COLORS.get(spec['color'], NOTE_COLORS['DEFAULT'])
+
+    icon = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    mask = Image.new('L', (size, size), 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, size - 1, size - 1), radius=10, fill=255)
+
+    if thumbnail is not None:
+        icon.paste(thumbnail, (0, 0), mask)
+        draw = ImageDraw.Draw(icon)
+        # note color as a frame so colored image notes stay recognizable
+        draw.rounded_rectangle((1, 1, size - 2, size - 2), radius=10, outline=color, width=4)
+    else:
+        icon.paste(Image.new('RGBA', (size, size), color), (0, 0), mask)
+        draw = ImageDraw.Draw(icon)
+        draw.rounded_rectangle((1, 1, size - 2, size - 2), radius=10, outline='#dadce0', width=2)
+        if not spec['checklist']:
+            for y in (22, 32, 42):
+                draw.line((16, y, size - 16 if y < 42 else size - 28, y), fill=INK_COLOR, width=3)
+
+    if spec['checklist']:
+        # checkbox badge, bottom left on thumbnails, centered otherwise
+        box = (6, size - 26, 26, size - 6) if thumbnail is not None else (20, 20, 44, 44)
+        draw.rectangle(box, fill='#ffffff', outline=INK_COLOR, width=3)
+        x0, y0, x1, y1 = box
+        w = x1 - x0
+        draw.line((x0 + w * 0.2, y0 + w * 0.5, x0 + w * 0.42, y0 + w * 0.72, x0 + w * 0.8, y0 + w * 0.28),
+                  fill=INK_COLOR, width=3)
+
+    if spec['pinned']:
+        draw.ellipse((size - 22, 4, size - 6, 20), fill=INK_COLOR, outline='#ffffff', width=2)
+
+    return icon
+
+
+def save_icon(icon, key):
+    path = ICON_CACHE_DIR / f"{key}.png"
+    tmp_path = path.with_suffix('.tmp')
+    icon.save(tmp_path, format='PNG', optimize=True)
+    os.replace(tmp_path, path)
+
+
+def enforce_cache_limit():
+    # least recently used first, the plugin bumps mtime on every cache hit
+    icons = []
+    for path in ICON_CACHE_DIR.glob('*.png'):
+        try:
+            stat = path.stat()
+            icons.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            pass
+
+    total = sum(size for _, size, _ in icons)
+    removed = 0
+    for _, size, path in sorted(icons):
+        if total <= ICON_CACHE_MAX_BYTES:
+            break
+        try:
+            path.unlink()
+            total -= size
+            removed += 1
+        except OSError as e:
+            logger.error(f"Failed to evict {path.name}: {e}")
+
+    if removed:
+        logger.info(f"Evicted {removed} icons, cache size: {total // 1024} KB")
+
+
+def render_icons(email, master_token, specs, failed, keep, lock):
+    # returns the Keep session so later rounds don't sync again
+    if keep is None and any(s['image'] for s in specs.values()):
+        try:
+            keep = gkeepapi.Keep()
+            keep.authenticate(email, master_token, sync=True)
+        except Exception as e:
+            logger.error(f"Authentication failed, rendering without thumbnails: {type(e).__name__}: {e}")
+            keep = None
+        lock.refresh()
+
+    rendered = 0
+    without_thumbnail = 0
+    for key, spec in specs.items():
+        try:
+            thumbnail = None
+            if spec['image'] and keep is not None:
+                try:
+                    thumbnail = fetch_thumbnail(keep, spec)
+                except Exception as e:
+                    logger.error(f"Failed to fetch thumbnail {key[:8]}: {type(e).__name__}: {e}")
+            save_icon(render_icon(spec, thumbnail), key)
+            rendered += 1
+
+            # plain icon stands in until the plugin asks for a retry
+            if spec['image'] and thumbnail is None:
+                failed[key] = time.time()
+                without_thumbnail += 1
+            else:
+                failed.pop(key, None)
+        except Exception as e:
+            logger.error(f"Failed to render icon {key[:8]}: {type(e).__name__}: {e}")
+        lock.refresh()
+
+    logger.info(f"Rendered {rendered}/{len(specs)} icons, {without_thumbnail} without thumbnail")
+    return keep
+
+
+def main():
+    if len(sys.argv) != 3:
+        logger.error(f"Invalid arguments count: {len(sys.argv)}")
+        sys.exit(1)
+
+    email = sys.argv[1]
+    master_token = sys.argv[2]
+
+    if not ICONS_ENABLED:
+        return
+
+    ICON_CACHE_DIR.mkdir(exist_ok=True)
+
+    # one icon worker at a time, the running one picks up new request files
+    lock = FileLock(ICON_LOCK_FILE, logger)
+    if not lock.acquire(timeout=0):
+        logger.info("Another icon worker is running")
+        return
+
+    try:
+        failed = load_failed()
+        keep = None
+        for _ in range(3):
+            # failed keys are cached too but were asked for again to retry
+            specs = {key: s for key, s in load_requests().items()
+                     if key in failed or not (ICON_CACHE_DIR / f"{key}.png").exists()}
+            if not specs:
+                break
+            keep = render_icons(email, master_token, specs, failed, keep, lock)
+
+        enforce_cache_limit()
+        save_failed(failed)
+    finally:
+        lock.release()
+
+
+if __name__ == "__main__":
+    main()
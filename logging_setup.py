@@ -0,0 +1,96 @@
+import logging
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+QUEUE_SIZE = 1000
+SAMPLE_ABOVE = 800  # queue size where info/debug records start being sampled
+SAMPLE_RATE = 10  # keep 1 of N info/debug records while sampling
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the caller.
+
+    Under load info/debug records are sampled, and once the queue is full
+    everything is dropped. Dropped records are counted and reported as a
+    single warning when the queue has room again.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+        self._sampled = 0
+
+    def enqueue(self, record):
+        # called under the handler lock, so the counters need no extra locking
+        backlog = self.queue.qsize()
+
+        # report once the backlog has drained well below the sampling mark
+        if self._unreported and backlog < SAMPLE_ABOVE // 2:
+            if self._put(self._dropped_record(record.name)):
+                self._unreported = 0
+
+        if record.levelno < logging.WARNING and backlog >= SAMPLE_ABOVE:
+            self._sampled += 1
+            if self._sampled % SAMPLE_RATE:
+                self._drop()
+                return
+
+        if not self._put(record):
+            self._drop()
+
+    def _put(self, record):
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+    def _drop(self):
+        self.dropped += 1
+        self._unreported += 1
+
+    def _dropped_record(self, name):
+        return logging.LogRecord(name, logging.WARNING, __file__, 0,
+                                 f"Dropped {self._unreported} log records under load "
+                                 f"({self.dropped} total)", None, None)
+
+
+class FlushingQueueListener(QueueListener):
+    """Queue listener whose stop() waits for room instead of failing on a full queue."""
+
+    def enqueue_sentinel(self):
+        # blocking put, the listener thread is still draining so this can't hang
+        self.queue.put(self._sentinel)
+
+
+def file_handler(path):
+    return RotatingFileHandler(
+        path,
+        maxBytes=1*1024*1024,
+        backupCount=1,
+        encoding='utf-8'
+    )
+
+
+def setup_queued_logging(logger, handler, level=logging.INFO):
+    # the real handler runs on a background thread, callers only enqueue
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.Queue(QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = FlushingQueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+
+    def shutdown():
+        # flush whatever is still queued, including the dropped count
+        if queue_handler._unreported:
+            log_queue.put(queue_handler._dropped_record(logger.name))
+        listener.stop()
+
+    atexit.register(shutdown)
+    return queue_handler
@@ -1,9 +1,13 @@
 import sys
 from pathlib import Path
 import webbrowser
-import logging
-from logging.handlers import RotatingFileHandler
 import subprocess
+import json
+import time
+import os
+import hashlib
+import uuid
+import importlib
 
 plugindir = Path(__file__).parent.resolve()
 if str(plugindir) not in sys.path:
@@ -14,25 +18,28 @@ if str(lib_path) not in sys.path:
 
 from flox import Flox
 import gkeepapi
+from logging_setup import setup_queued_logging, file_handler
+from file_lock import STALE_LOCK_AGE
+from note_queue import load_queue, add_toggle_to_queue
+
+CHECKLIST_CACHE_FILE = plugindir / "checklist_cache.json"
+CHECKLIST_CACHE_TTL = 120  # secs, refetch from server after this
+ICON_CACHE_DIR = plugindir / "icon_cache"
+ICON_LOCK_FILE = plugindir / "icon_worker.lock"
+FAILED_ICONS_FILE = ICON_CACHE_DIR / "failed.json"
+ICON_RETRY_AFTER = 3600  # secs before retrying a thumbnail that failed to download
 
 
 class GoogleKeepPlugin(Flox):
     def __init__(self):
         super().__init__()
         self.keep = None
+        self._icons_enabled = None
 
         for handler in self.logger.handlers[:]:
             self.logger.removeHandler(handler)
 
-        log_handler = RotatingFileHandler(
-            plugindir / "plugin.log",
-            maxBytes=1*1024*1024,
-            backupCount=1,
-            encoding='utf-8'
-        )
-        log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-        self.logger.addHandler(log_handler)
-        self.logger.setLevel(logging.INFO)
+        setup_queued_logging(self.logger, file_handler(plugindir / "plugin.log"))
 
     def query(self, query_text):
         email = self.settings.get('email', '').strip()
@@ -56,7 +63,7 @@ class GoogleKeepPlugin(Flox):
         if not query_text.strip():
             self.add_item(
                 title="GoogleKeepFlow",
-                subtitle="Type text to add as a note, or 'list' to view recent notes",
+                subtitle="Type text to add as a note, 'list' to view recent notes or 'todo' for checklists",
                 icon="keep.png"
             )
             return
@@ -65,6 +72,10 @@ class GoogleKeepPlugin(Flox):
             self.list_notes(email, master_token)
             return
 
+        if query_text.strip().lower() == 'todo' or query_text.strip().lower().startswith('todo '):
+            self.show_checklist(email, master_token, query_text.strip()[4:].strip())
+            return
+
         self.add_item(
             title=f"Add note: {query_text}",
             subtitle="Press Enter to add to Google Keep",
@@ -99,6 +110,8 @@ class GoogleKeepPlugin(Flox):
                 )
                 return
 
+            missing_icons = []
+            failed_icons = self.load_failed_icons()
             for note in notes:
                 if note.title:
                     title = note.title.replace('\n', ' ').strip()
@@ -120,11 +133,14 @@ class GoogleKeepPlugin(Flox):
                 self.add_item(
                     title=title,
                     subtitle=subtitle if subtitle else "Click to open in Google Keep",
-                    icon="keep.png",
+                    icon=self.note_icon(note, missing_icons, failed_icons),
                     method=self.open_note,
                     parameters=[note.id]
                 )
 
+            if missing_icons:
+                self.request_icons(email, master_token, missing_icons)
+
         except Exception as e:
             self.logger.error(f"Failed to list notes: {type(e).__name__}: {e}")
             self.add_item(
@@ -133,13 +149,276 @@ class GoogleKeepPlugin(Flox):
                 icon="keep.png"
             )
 
+    def show_checklist(self, email, master_token, name):
+        try:
+            checklists = self.load_checklists(email, master_token)
+        except Exception as e:
+            self.logger.error(f"Failed to load checklists: {type(e).__name__}: {e}")
+            self.add_item(
+                title="Failed to load checklists",
+                subtitle=str(e),
+                icon="keep.png"
+            )
+            return
+
+        if not name:
+            if not checklists:
+                self.add_item(
+                    title="No checklists found",
+                    subtitle="Create a checklist in Google Keep first",
+                    icon="keep.png"
+                )
+                return
+
+            self.add_checklist_choices(checklists.values())
+            return
+
+        # lists are navigated by id, titles can be empty or shared,
+        # '#' not followed by a known id is just part of a title
+        checklist = checklists.get(name[1:]) if name.startswith('#') else None
+        matches = [checklist] if checklist else self.find_checklists(checklists, name)
+
+        if not matches:
+            self.add_item(
+                title=f"No checklist matching '{name}'",
+                subtitle="Type 'todo' to see all checklists",
+                icon="keep.png"
+            )
+            self.add_item(
+                title=f"Add note: todo {name}",
+                subtitle="Press Enter to add to Google Keep",
+                icon="keep.png",
+                method=self.add_note,
+                parameters=[email, master_token, f"todo {name}"]
+            )
+            return
+
+        if len(matches) > 1:
+            self.add_checklist_choices(matches)
+            return
+
+        checklist = matches[0]
+        if not checklist['items']:
+            self.add_item(
+                title=f"{self.checklist_title(checklist)} is empty",
+                subtitle="Click to open in Google Keep",
+                icon="keep.png",
+                method=self.open_note,
+                parameters=[checklist['id']]
+            )
+            return
+
+        pending = {t['item_id'] for t in self.load_pending_toggles(email)}
+        for item in checklist['items']:
+            subtitle = "Press Enter to uncheck" if item['checked'] else "Press Enter to check"
+            if item['id'] in pending:
+                subtitle += " (waiting for sync)"
+            self.add_item(
+                title=f"{'☑' if item['checked'] else '☐'} {item['text']}",
+                subtitle=subtitle,
+                icon="keep.png",
+                method=self.toggle_item,
+                parameters=[email, master_token, checklist['id'], item['id'], not item['checked']],
+                dont_hide=True
+            )
+
+    def add_checklist_choices(self, checklists):
+        for checklist in checklists:
+            done = len([i for i in checklist['items'] if i['checked']])
+            self.add_item(
+                title=self.checklist_title(checklist),
+                subtitle=f"{done}/{len(checklist['items'])} done",
+                icon="keep.png",
+                method=self.change_query,
+                parameters=[f"{self.user_keyword} todo #{checklist['id']}", True],
+                dont_hide=True
+            )
+
+    def checklist_title(self, checklist):
+        if checklist['title']:
+            return checklist['title']
+        if checklist['items']:
+            return f"Untitled: {checklist['items'][0]['text'][:40]}"
+        return "Untitled checklist"
+
+    def find_checklists(self, checklists, name):
+        # exact title matches win, otherwise every list whose title contains name
+        name = name.lower()
+        exact = [c for c in checklists.values() if c['title'].lower() == name]
+        if exact:
+            return exact
+        return [c for c in checklists.values() if name in c['title'].lower()]
+
+    def load_checklists(self, email, master_token):
+        # serve from local state while fresh so toggles show up instantly,
+        # and while toggles wait for sync the local state is the newest we have
+        cache = self.load_checklist_cache()
+        if cache.get('email') == email:
+            fresh = time.time() - cache.get('fetched', 0) < CHECKLIST_CACHE_TTL
+            if fresh or self.load_pending_toggles(email):
+                return cache['checklists']
+
+        self.logger.info("Fetching checklists...")
+        keep = gkeepapi.Keep()
+        keep.authenticate(email, master_token, sync=True)
+
+        lists = sorted([n for n in keep.all()
+                        if isinstance(n, gkeepapi.node.List) and not n.trashed and not n.archived],
+                       key=lambda x: x.timestamps.updated,
+                       reverse=True)
+
+        checklists = {}
+        for note in lists:
+            checklists[note.id] = {
+                'id': note.id,
+                'title': note.title.replace('\n', ' ').strip(),
+                'items': [{'id': i.id, 'text': i.text.replace('\n', ' ').strip(), 'checked': i.checked}
+                          for i in note.items]
+            }
+
+        # toggles the worker has not synced yet still win over server state
+        for toggle in self.load_pending_toggles(email):
+            checklist = checklists.get(toggle['note_id'])
+            if checklist is None:
+                continue
+            for item in checklist['items']:
+                if item['id'] == toggle['item_id']:
+                    item['checked'] = toggle['checked']
+
+        self.save_checklist_cache({'email': email, 'fetched': time.time(), 'checklists': checklists})
+        self.logger.info(f"Loaded {len(checklists)} checklists")
+        return checklists
+
+    def load_checklist_cache(self):
+        try:
+            if CHECKLIST_CACHE_FILE.exists():
+                with open(CHECKLIST_CACHE_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Failed to load checklist cache: {e}")
+        return {}
+
+    def save_checklist_cache(self, cache):
+        tmp_file = CHECKLIST_CACHE_FILE.with_suffix('.tmp')
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_file, CHECKLIST_CACHE_FILE)
+        except Exception as e:
+            self.logger.error(f"Failed to save checklist cache: {e}")
+
+    def load_pending_toggles(self, email):
+        return sorted([i for i in load_queue() if i.get('type') == 'toggle' and i['email'] == email],
+                      key=lambda x: x['timestamp'])
+
+    def toggle_item(self, email, master_token, note_id, item_id, checked):
+        self.logger.info(f"Toggling item {item_id} in {note_id} -> {checked}")
+
+        # optimistic update, the worker syncs in the background
+        cache = self.load_checklist_cache()
+        checklist = cache.get('checklists', {}).get(note_id)
+        if checklist is not None:
+            for item in checklist['items']:
+                if item['id'] == item_id:
+                    item['checked'] = checked
+            self.save_checklist_cache(cache)
+
+        # queued here rather than by the worker so the requery already sees it as pending
+        add_toggle_to_queue(email, master_token, note_id, item_id, checked)
+
+        show_notifications = str(self.settings.get('show_notifications', True))
+        if not self.start_worker(['--process', show_notifications]):
+            return "Failed to start sync worker"
+
+        self.change_query(f"{self.user_keyword} todo #{note_id}", True)
+        return "Item toggled!"
+
+    def note_icon(self, note, missing, failed):
+        # never render here, fall back to keep.png and let icon_worker fill the cache
+        if not self.icons_enabled():
+            return "keep.png"
+
+        spec = {
+            'color': note.color.value,
+            'pinned': note.pinned,
+            'checklist': isinstance(note, gkeepapi.node.List),
+            'image': note.images[0].server_id if note.images else None
+        }
+        key = hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+        path = ICON_CACHE_DIR / f"{key}.png"
+
+        spec['key'] = key
+        spec['note_id'] = note.id
+
+        if path.exists():
+            try:
+                # mark as recently used for LRU eviction
+                os.utime(path)
+            except OSError:
+                pass
+            # cached without its thumbnail, retry the download once in a while
+            if key in failed and time.time() - failed[key] > ICON_RETRY_AFTER:
+                missing.append(spec)
+            return str(path)
+
+        missing.append(spec)
+        return "keep.png"
+
+    def icons_enabled(self):
+        # probed on first use only, importing Pillow costs ~40ms per plugin process
+        if self._icons_enabled is None:
+            try:
+                # the compiled extension may not load for this python even if the package is there
+                importlib.import_module('PIL.Image')
+                self._icons_enabled = True
+            except ImportError:
+                self._icons_enabled = False
+                self.logger.warning("Pillow not available, note icons disabled")
+        return self._icons_enabled
+
+    def load_failed_icons(self):
+        try:
+            if FAILED_ICONS_FILE.exists():
+                with open(FAILED_ICONS_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Failed to load failed icons: {e}")
+        return {}
+
+    def request_icons(self, email, master_token, specs):
+        request_file = ICON_CACHE_DIR / f"request-{uuid.uuid4().hex}.json"
+        try:
+            ICON_CACHE_DIR.mkdir(exist_ok=True)
+            with open(request_file, 'w', encoding='utf-8') as f:
+                json.dump(specs, f)
+        except Exception as e:
+            self.logger.error(f"Failed to write icon request: {e}")
+            return
+
+        self.logger.info(f"Requesting {len(specs)} icons")
+
+        # a running icon worker merges all pending request files before it exits
+        try:
+            if time.time() - ICON_LOCK_FILE.stat().st_mtime < STALE_LOCK_AGE:
+                self.logger.info("Icon worker already running")
+                return
+        except FileNotFoundError:
+            pass
+        self.start_worker([email, master_token], script="icon_worker.py")
+
     def add_note(self, email, master_token, text):
         self.logger.info(f"Adding note: {text[:50]}...")
 
-        worker_script = plugindir / "sync_worker.py"
         # checkbox returns boolean, convert to string for subprocess
         show_notifications = str(self.settings.get('show_notifications', True))
 
+        if self.start_worker([email, master_token, text, show_notifications]):
+            return "Note added!"
+        return "Failed to start sync worker"
+
+    def start_worker(self, args, script="sync_worker.py"):
+        worker_script = plugindir / script
+
         try:
             startupinfo = None
             creationflags = 0
@@ -150,7 +429,7 @@ class GoogleKeepPlugin(Flox):
                 creationflags = subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
 
             subprocess.Popen(
-                [sys.executable, str(worker_script), email, master_token, text, show_notifications],
+                [sys.executable, str(worker_script)] + args,
                 startupinfo=startupinfo,
                 creationflags=creationflags,
                 start_new_session=True,
@@ -158,11 +437,11 @@ class GoogleKeepPlugin(Flox):
                 stderr=subprocess.DEVNULL,
                 stdin=subprocess.DEVNULL
             )
-            self.logger.info("Sync worker started")
-            return "Note added!"
+            self.logger.info(f"Worker started: {script}")
+            return True
         except Exception as e:
-            self.logger.error(f"Failed to start sync worker: {type(e).__name__}: {e}")
-            return f"Failed: {str(e)}"
+            self.logger.error(f"Failed to start {script}: {type(e).__name__}: {e}")
+            return False
 
     def authenticate(self, email, master_token):
         if self.keep is not None:
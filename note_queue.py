@@ -0,0 +1,87 @@
+import os
+import time
+import json
+import logging
+from pathlib import Path
+
+from file_lock import FileLock
+
+plugindir = Path(__file__).parent.resolve()
+QUEUE_FILE = plugindir / "note_queue.json"
+QUEUE_LOCK_FILE = plugindir / "queue.lock"
+
+# child of the worker logger, in the plugin it propagates to plugin.log
+logger = logging.getLogger('sync_worker.queue')
+
+
+def load_queue():
+    try:
+        if QUEUE_FILE.exists():
+            with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Failed to load queue: {e}")
+    return []
+
+
+def save_queue(queue):
+    # write to temp file first so the plugin never reads a half-written queue
+    tmp_file = QUEUE_FILE.with_suffix('.tmp')
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(queue, f, ensure_ascii=False)
+        os.replace(tmp_file, QUEUE_FILE)
+    except Exception as e:
+        logger.error(f"Failed to save queue: {e}")
+
+
+def add_to_queue(email, master_token, text):
+    enqueue({
+        'email': email,
+        'master_token': master_token,
+        'text': text,
+        'timestamp': time.time()
+    })
+
+
+def add_toggle_to_queue(email, master_token, note_id, item_id, checked):
+    enqueue({
+        'type': 'toggle',
+        'email': email,
+        'master_token': master_token,
+        'note_id': note_id,
+        'item_id': item_id,
+        'checked': checked,
+        'timestamp': time.time()
+    })
+
+
+def enqueue(item):
+    # short lock, separate from the worker lock, so new items can be added
+    # while another worker is debouncing or syncing
+    lock = FileLock(QUEUE_LOCK_FILE, logger)
+    locked = lock.acquire(timeout=5)
+    if not locked:
+        logger.warning("Could not acquire queue lock, adding anyway")
+    try:
+        queue = load_queue()
+        queue.append(item)
+        save_queue(queue)
+        logger.info(f"Added to queue, total items: {len(queue)}")
+    finally:
+        if locked:
+            lock.release()
+
+
+def finish_queue(processed, failed):
+    # drop processed items but keep anything enqueued while we were syncing
+    lock = FileLock(QUEUE_LOCK_FILE, logger)
+    locked = lock.acquire(timeout=5)
+    try:
+        done = [item for item in processed if item not in failed]
+        remaining = [item for item in load_queue() if item not in done]
+        save_queue(remaining)
+        return remaining, [item for item in remaining if item not in processed]
+    finally:
+        if locked:
+            lock.release()
@@ -2,7 +2,6 @@
 import sys
 from pathlib import Path
 import logging
-from logging.handlers import RotatingFileHandler
 import json
 import time
 import os
@@ -15,21 +14,18 @@ if str(lib_path) not in sys.path:
     sys.path.insert(0, str(lib_path))
 
 import gkeepapi
+from logging_setup import setup_queued_logging, file_handler
+from file_lock import FileLock
+from note_queue import load_queue, add_to_queue, finish_queue
 
-QUEUE_FILE = plugindir / "note_queue.json"
 LOCK_FILE = plugindir / "worker.lock"
+CHECKLIST_CACHE_FILE = plugindir / "checklist_cache.json"
+TOGGLE_DEBOUNCE = 1.5  # wait for more toggles before syncing
+TOGGLE_DEBOUNCE_MAX = 10
 USER_WANTS_NOTIFICATIONS = True
 
-log_handler = RotatingFileHandler(
-    plugindir / "worker.log",
-    maxBytes=1*1024*1024,
-    backupCount=1,
-    encoding='utf-8'
-)
-log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
 logger = logging.getLogger('sync_worker')
-logger.addHandler(log_handler)
-logger.setLevel(logging.INFO)
+setup_queued_logging(logger, file_handler(plugindir / "worker.log"))
 
 try:
     from winotify import Notification
@@ -39,73 +35,18 @@ except ImportError:
     logger.warning("winotify not installed, notifications disabled")
 
 
-class FileLock:
-    def __init__(self, lock_file):
-        self.lock_file = Path(lock_file)
-        self.fd = None
-    
-    def acquire(self, timeout=0):
-        # OS-level exclusive lock with stale lock detection (60sec timeout)
-        start = time.time()
-        while True:
-            try:
-                self.fd = os.open(str(self.lock_file), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-                os.write(self.fd, str(os.getpid()).encode())
-                return True
-            except FileExistsError:
-                try:
-                    if time.time() - self.lock_file.stat().st_mtime > 60:
-                        logger.warning("Removing stale lock file")
-                        self.lock_file.unlink()
-                        continue
-                except:
-                    pass
-                
-                if timeout == 0 or (time.time() - start) >= timeout:
-                    return False
-                time.sleep(0.1)
-    
-    def release(self):
-        if self.fd is not None:
-            try:
-                os.close(self.fd)
-            except Exception as e:
-                logger.error(f"Failed to close lock file descriptor: {e}")
-            self.fd = None
-        try:
-            self.lock_file.unlink()
-        except Exception as e:
-            logger.error(f"Failed to delete lock file: {e}")
-
-
-def load_queue():
-    try:
-        if QUEUE_FILE.exists():
-            with open(QUEUE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"Failed to load queue: {e}")
-    return []
-
-
-def save_queue(queue):
-    try:
-        with open(QUEUE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(queue, f, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Failed to save queue: {e}")
-
-
-def add_to_queue(email, master_token, text):
-    queue = load_queue()
-    queue.append({
-        'email': email,
-        'master_token': master_token,
-        'text': text,
-        'timestamp': time.time()
-    })
-    save_queue(queue)
-    logger.info(f"Added to queue, total items: {len(queue)}")
+def wait_for_quiet_queue(lock):
+    # debounce: sync once no new toggle arrived for TOGGLE_DEBOUNCE seconds
+    start = time.time()
+    while time.time() - start < TOGGLE_DEBOUNCE_MAX:
+        lock.refresh()
+        queue = load_queue()
+        if not any(item.get('type') == 'toggle' for item in queue):
+            return
+        newest = max(item.get('timestamp', 0) for item in queue)
+        if time.time() - newest >= TOGGLE_DEBOUNCE:
+            return
+        time.sleep(0.2)
 
 
 def show_notification(title, message):
@@ -130,39 +71,141 @@ def show_notification(title, message):
         logger.error(f"Failed to show notification: {e}")
 
 
-def process_queue():
+def update_checklist_cache(keep, email, note_ids, pending):
+    # replace the plugin's optimistic state with what the server kept,
+    # then re-apply toggles that are still waiting in the queue
+    try:
+        with open(CHECKLIST_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.error(f"Failed to load checklist cache: {e}")
+        return
+
+    if cache.get('email') != email:
+        return
+
+    checklists = cache.get('checklists', {})
+    for note_id in note_ids:
+        note = keep.get(note_id)
+        if note is None or note.trashed or note.archived or not isinstance(note, gkeepapi.node.List):
+            checklists.pop(note_id, None)
+            continue
+        checklists[note_id] = {
+            'id': note.id,
+            'title': note.title.replace('\n', ' ').strip(),
+            'items': [{'id': i.id, 'text': i.text.replace('\n', ' ').strip(), 'checked': i.checked}
+                      for i in note.items]
+        }
+
+    for toggle in sorted(pending, key=lambda x: x['timestamp']):
+        checklist = checklists.get(toggle['note_id'])
+        if checklist is None:
+            continue
+        for item in checklist['items']:
+            if item['id'] == toggle['item_id']:
+                item['checked'] = toggle['checked']
+
+    tmp_file = CHECKLIST_CACHE_FILE.with_suffix('.tmp')
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_file, CHECKLIST_CACHE_FILE)
+    except Exception as e:
+        logger.error(f"Failed to save checklist cache: {e}")
+
+
+def apply_toggles(keep, toggles):
+    # returns list of conflicts as human readable strings
+    conflicts = []
+    toggled = 0
+    unchanged = 0
+
+    # several toggles of the same item collapse into the latest one
+    latest = {}
+    for toggle in sorted(toggles, key=lambda x: x['timestamp']):
+        latest[(toggle['note_id'], toggle['item_id'])] = toggle
+
+    for (note_id, item_id), toggle in latest.items():
+        note = keep.get(note_id)
+        if note is None or note.trashed or not isinstance(note, gkeepapi.node.List):
+            logger.warning(f"Conflict: list {note_id} was removed, dropping toggle")
+            conflicts.append("list was removed")
+            continue
+
+        item = next((i for i in note.items if i.id == item_id), None)
+        if item is None:
+            logger.warning(f"Conflict: item {item_id} was removed from '{note.title[:30]}', dropping toggle")
+            conflicts.append(f"item removed from {note.title[:30]}")
+            continue
+
+        if item.checked == toggle['checked']:
+            unchanged += 1
+            continue
+
+        # item changed on another device after we toggled it, remote wins
+        if item.timestamps.updated.timestamp() > toggle['timestamp']:
+            logger.warning(f"Conflict: item '{item.text[:30]}' changed remotely, keeping remote state")
+            conflicts.append(item.text[:30])
+            continue
+
+        item.checked = toggle['checked']
+        toggled += 1
+
+    logger.info(f"Toggles: {toggled} applied, {unchanged} already in desired state, {len(conflicts)} conflicts")
+    return conflicts
+
+
+def process_queue(lock):
+    # returns True if new items were queued while processing
     queue = load_queue()
     if not queue:
         logger.info("Queue is empty")
-        return
+        return False
 
     # group items by account but keep track of original items
     by_account = {}
     for item in queue:
         key = (item['email'], item['master_token'])
         if key not in by_account:
-            by_account[key] = {'texts': [], 'items': []}
-        by_account[key]['texts'].append(item['text'])
+            by_account[key] = {'texts': [], 'toggles': [], 'items': []}
+        if item.get('type') == 'toggle':
+            by_account[key]['toggles'].append(item)
+        else:
+            by_account[key]['texts'].append(item['text'])
         by_account[key]['items'].append(item)
 
     # track items to keep in queue (failed ones)
     items_to_keep = []
+    # synced accounts whose checklists the plugin has cached
+    synced_toggles = []
 
     for (email, master_token), data in by_account.items():
         texts = data['texts']
+        toggles = data['toggles']
         items = data['items']
-        logger.info(f"Processing {len(texts)} notes for {email[:20]}...")
+        logger.info(f"Processing {len(texts)} notes and {len(toggles)} toggles for {email[:20]}...")
+        lock.refresh()
 
         try:
             keep = gkeepapi.Keep()
-            keep.authenticate(email, master_token, sync=False)
+            # toggles need the current server state to reconcile against
+            keep.authenticate(email, master_token, sync=bool(toggles))
 
             for text in texts:
                 keep.createNote(title='', text=text)
-                logger.info(f"Created note: {text[:30]}...")
+            if texts:
+                previews = ', '.join(f"'{text[:20]}'" for text in texts[:5])
+                more = f" and {len(texts) - 5} more" if len(texts) > 5 else ""
+                logger.info(f"Created {len(texts)} notes: {previews}{more}")
+
+            conflicts = apply_toggles(keep, toggles) if toggles else []
 
             keep.sync()
-            logger.info(f"Synced {len(texts)} notes successfully")
+            logger.info(f"Synced {len(texts)} notes and {len(toggles)} toggles successfully")
+            if toggles:
+                synced_toggles.append((keep, email, {t['note_id'] for t in toggles}))
 
             if len(texts) == 1:
                 note_preview = texts[0][:50]
@@ -172,12 +215,18 @@ def process_queue():
                     "Note Created",
                     f"Successfully added: {note_preview}"
                 )
-            else:
+            elif len(texts) > 1:
                 show_notification(
                     "Notes Created",
                     f"Successfully added {len(texts)} notes to Google Keep"
                 )
 
+            if conflicts:
+                show_notification(
+                    "Checklist Conflict",
+                    f"Kept changes made elsewhere for {len(conflicts)} item(s)"
+                )
+
         except Exception as e:
             logger.error(f"Failed to process notes: {type(e).__name__}: {e}")
 
@@ -185,46 +234,59 @@ def process_queue():
             if len(error_msg) > 80:
                 error_msg = error_msg[:80] + "..."
             show_notification(
-                "Failed to Create Note",
+                "Failed to Sync" if toggles and not texts else "Failed to Create Note",
                 f"Error: {error_msg}"
             )
 
             # keep failed items in queue for retry
             items_to_keep.extend(items)
-            logger.info(f"Failed notes kept in queue for retry")
+            logger.info("Failed items kept in queue for retry")
 
-    save_queue(items_to_keep)
-    logger.info(f"Queue updated: {len(items_to_keep)} items remaining")
+    remaining, new_items = finish_queue(queue, items_to_keep)
+    logger.info(f"Queue updated: {len(remaining)} items remaining")
+
+    for keep, email, note_ids in synced_toggles:
+        pending = [i for i in remaining if i.get('type') == 'toggle' and i['email'] == email]
+        update_checklist_cache(keep, email, note_ids, pending)
+    return bool(new_items)
 
 
 def main():
     global USER_WANTS_NOTIFICATIONS
 
-    if len(sys.argv) != 5:
+    # note:    <email> <master_token> <text> <show_notifications>
+    # process: --process <show_notifications>  (items already queued by the plugin)
+    process_only = len(sys.argv) > 1 and sys.argv[1] == '--process'
+    if len(sys.argv) != (3 if process_only else 5):
         logger.error(f"Invalid arguments count: {len(sys.argv)}")
         sys.exit(1)
 
-    email = sys.argv[1]
-    master_token = sys.argv[2]
-    text = sys.argv[3]
-    show_notifications_str = sys.argv[4]
+    if process_only:
+        show_notifications_str = sys.argv[2]
+        description = "queued items"
+    else:
+        email, master_token, text, show_notifications_str = sys.argv[1:]
+        add_to_queue(email, master_token, text)
+        description = f"note: {text[:50]}..."
 
     USER_WANTS_NOTIFICATIONS = str(show_notifications_str).lower() in ('true', '1', 'yes', 'on')
-    logger.info(f"Worker started for note: {text[:50]}... (notifications: {USER_WANTS_NOTIFICATIONS})")
+    logger.info(f"Worker started for {description} (notifications: {USER_WANTS_NOTIFICATIONS})")
 
-    # acquire lock before queue operations to prevent race conditions
-    lock = FileLock(LOCK_FILE)
+    # item is already queued, if another worker is busy it (or the next one) picks it up
+    lock = FileLock(LOCK_FILE, logger)
     if not lock.acquire(timeout=5):
         logger.warning("Could not acquire lock after 5 seconds, another worker is busy")
-        add_to_queue(email, master_token, text)
         return
 
     try:
-        add_to_queue(email, master_token, text)
-
         time.sleep(0.3)
 
-        process_queue()
+        # pick up items queued by workers that gave up waiting for the lock
+        for _ in range(3):
+            lock.refresh()
+            wait_for_quiet_queue(lock)
+            if not process_queue(lock):
+                break
 
     finally:
         lock.release()
@@ -4,14 +4,27 @@ import hashlib
 import secrets
 import logging
 import re
+import ipaddress
+import gzip
+import heapq
+import itertools
+import mimetypes
+from pathlib import Path
 from datetime import datetime, timedelta
 from functools import wraps
 from collections import defaultdict
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, abort
 
 import gpsoauth
 
+from logging_setup import setup_queued_logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # ANTI-SPAM
 MAX_REQUESTS_PER_IP_PER_HOUR = 5
 MAX_REQUESTS_PER_IP_PER_DAY = 10
@@ -22,24 +35,191 @@ CHALLENGE_TTL = 300  # 5 mins
 FAILED_ATTEMPTS_BLOCK_THRESHOLD = 10  # Block IP after N failed attempts
 BLOCK_DURATION = 3600  # 60 mins
 
+# limits and blocks apply to whole networks so a client can't rotate addresses
+# (ip version, prefix length, requests/hour, requests/day, failed attempts before block)
+IP_PREFIX_RULES = [
+    (4, 24, MAX_REQUESTS_PER_IP_PER_HOUR, MAX_REQUESTS_PER_IP_PER_DAY, FAILED_ATTEMPTS_BLOCK_THRESHOLD),
+    (6, 64, MAX_REQUESTS_PER_IP_PER_HOUR, MAX_REQUESTS_PER_IP_PER_DAY, FAILED_ATTEMPTS_BLOCK_THRESHOLD),
+    (6, 48, MAX_REQUESTS_PER_IP_PER_HOUR * 4, MAX_REQUESTS_PER_IP_PER_DAY * 4, FAILED_ATTEMPTS_BLOCK_THRESHOLD * 3),
+]
+
 # WALLET AND BALLS PROTECTION
 ABSOLUTE_DAILY_LIMIT = 500
 ABSOLUTE_MONTHLY_LIMIT = 5000
 
-app = Flask(__name__)
+# STATIC ASSETS
+STATIC_DIR = Path(__file__).parent / 'static'
+HASHED_MAX_AGE = 31536000  # 1 year, hashed urls change with content
+UNHASHED_MAX_AGE = 3600
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s'
-)
+# static files are served from memory below, not by flask
+app = Flask(__name__, static_folder=None)
+
+# request threads only enqueue log records, a background thread writes them
+log_handler = setup_queued_logging(logging.getLogger(), logging.StreamHandler())
 log = logging.getLogger(__name__)
 
+
+class PrefixTrie:
+    """Binary trie of blocked networks, lookups walk at most 32/128 bits."""
+
+    def __init__(self):
+        self.roots = {4: {}, 6: {}}
+        self.ranges = {}  # network -> unblock_timestamp
+        self.expiry = []  # min-heap of (unblock_timestamp, seq, network)
+        self._seq = itertools.count()  # tie breaker, v4 and v6 networks don't compare
+
+    @staticmethod
+    def _bits(address, length):
+        value = int(address)
+        for i in range(length):
+            yield (value >> (address.max_prefixlen - 1 - i)) & 1
+
+    def add(self, network, until):
+        node = self.roots[network.version]
+        for bit in self._bits(network.network_address, network.prefixlen):
+            node = node.setdefault(bit, {})
+        node['until'] = until
+        self.ranges[network] = until
+        heapq.heappush(self.expiry, (until, next(self._seq), network))
+
+    def remove(self, network):
+        path = [self.roots[network.version]]
+        for bit in self._bits(network.network_address, network.prefixlen):
+            path.append(path[-1].get(bit))
+            if path[-1] is None:
+                return
+        path[-1].pop('until', None)
+        self.ranges.pop(network, None)
+
+        # prune empty branches
+        bits = list(self._bits(network.network_address, network.prefixlen))
+        for depth in range(len(bits), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][bits[depth - 1]]
+
+    def lookup(self, address, now=None):
+        # returns (network, unblock_timestamp) of the widest blocked range containing address,
+        # expired ranges met on the way are removed
+        now = time.time() if now is None else now
+        node = self.roots[address.version]
+        depth = 0
+        bits = self._bits(address, address.max_prefixlen)
+        while True:
+            if 'until' in node:
+                network = ipaddress.ip_network((address, depth), strict=False)
+                if node['until'] >= now:
+                    return network, node['until']
+                self.remove(network)
+                log.info(f"Unblocked range: {network}")
+            bit = next(bits, None)
+            if bit is None:
+                return None
+            node = node.get(bit)
+            if node is None:
+                return None
+            depth += 1
+
+    def expire(self, now):
+        # pops only expired entries, stale ones (re-blocked or already removed) are skipped
+        removed = []
+        while self.expiry and self.expiry[0][0] < now:
+            until, _, network = heapq.heappop(self.expiry)
+            if self.ranges.get(network) == until:
+                self.remove(network)
+                removed.append(network)
+        return removed
+
+    def count_by_prefix(self):
+        return count_by_prefix(self.ranges)
+
+    def __len__(self):
+        return len(self.ranges)
+
+
+def build_asset(data, mimetype):
+    # precompress once, keep only variants that are actually smaller
+    bodies = {'identity': data}
+    if mimetype.startswith(COMPRESSIBLE_TYPES):
+        bodies['gzip'] = gzip.compress(data, compresslevel=9)
+        if brotli is not None:
+            bodies['br'] = brotli.compress(data, quality=11)
+        bodies = {enc: body for enc, body in bodies.items() if enc == 'identity' or len(body) < len(data)}
+    return {
+        'etag': hashlib.sha256(data).hexdigest()[:16],
+        'mimetype': mimetype,
+        'bodies': bodies
+    }
+
+
+def load_static_assets():
+    # name -> asset and hashed name (style.<hash>.css) -> asset
+    assets, hashed = {}, {}
+    for path in sorted(STATIC_DIR.iterdir()):
+        if not path.is_file():
+            continue
+        mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        asset = build_asset(path.read_bytes(), mimetype)
+        asset['url'] = f"/static/{path.stem}.{asset['etag'][:10]}{path.suffix}"
+        assets[path.name] = asset
+        hashed[asset['url'].rsplit('/', 1)[1]] = asset
+    log.info(f"Loaded {len(assets)} static assets (brotli: {brotli is not None})")
+    return assets, hashed
+
+
+def asset_url(name):
+    asset = static_assets.get(name)
+    return asset['url'] if asset else f"/static/{name}"
+
+
+def send_asset(asset, cache_control):
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['bodies'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    # compressed variants are different representations, so they get their own etag
+    etag = asset['etag'] if encoding == 'identity' else f"{asset['etag']}-{encoding}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset['bodies'][encoding], mimetype=asset['mimetype'])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+static_assets, hashed_assets = load_static_assets()
+app.jinja_env.globals['asset_url'] = asset_url
+index_page = None  # rendered once on first hit
+
+
+def count_by_prefix(networks):
+    # e.g. {'ipv4/24': 3, 'ipv6/64': 2, 'ipv6/48': 2}
+    counts = defaultdict(int)
+    for network in networks:
+        try:
+            network = ipaddress.ip_network(network)
+        except ValueError:
+            counts['unparsed'] += 1
+            continue
+        counts[f"ipv{network.version}/{network.prefixlen}"] += 1
+    return dict(counts)
+
+
 # STATE
-ip_requests = defaultdict(list)
-ip_failed_attempts = defaultdict(int)  # track failed auth attempts
+ip_requests = defaultdict(list)  # network -> request timestamps
+ip_failed_attempts = defaultdict(int)  # track failed auth attempts per network
 global_requests = []
 monthly_requests = []
-blocked_ips = {}  # IP -> unblock_timestamp
+blocked_ranges = PrefixTrie()
 challenges = {}
 used_challenges = {}
 
@@ -51,30 +231,53 @@ APP_PASSWORD_REGEX = re.compile(r'^[a-z]{16}$')  # Google app passwords are 16 l
 def get_client_ip():
     if request.headers.get('X-Forwarded-For'):
         ip = request.headers.get('X-Forwarded-For').split(',')[0].strip()
-        if re.match(r'^(\d{1,3}\.){3}\d{1,3}$', ip) or ':' in ip:
+        if parse_ip(ip) is not None:
             return ip
     return request.remote_addr
 
 
+def parse_ip(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    # v4-mapped v6 addresses are plain v4 clients
+    if address.version == 6 and address.ipv4_mapped:
+        return address.ipv4_mapped
+    return address
+
+
+def get_ip_keys(ip):
+    # (network key, requests/hour, requests/day, failed attempts before block), most specific first
+    address = parse_ip(ip)
+    if address is None:
+        return [(ip, MAX_REQUESTS_PER_IP_PER_HOUR, MAX_REQUESTS_PER_IP_PER_DAY, FAILED_ATTEMPTS_BLOCK_THRESHOLD)]
+
+    keys = []
+    for version, prefix, per_hour, per_day, max_failed in sorted(IP_PREFIX_RULES, key=lambda r: -r[1]):
+        if version == address.version:
+            network = ipaddress.ip_network((address, prefix), strict=False)
+            keys.append((str(network), per_hour, per_day, max_failed))
+    return keys
+
+
 def cleanup_old_requests():
     now = time.time()
     hour_ago = now - 3600
     day_ago = now - 86400
     month_ago = now - 86400 * 30
 
-    for ip in list(ip_requests.keys()):
-        ip_requests[ip] = [t for t in ip_requests[ip] if t > day_ago]
-        if not ip_requests[ip]:
-            del ip_requests[ip]
+    for key in list(ip_requests.keys()):
+        ip_requests[key] = [t for t in ip_requests[key] if t > day_ago]
+        if not ip_requests[key]:
+            del ip_requests[key]
 
-    for ip in list(ip_failed_attempts.keys()):
-        if ip not in ip_requests or not ip_requests[ip]:
-            del ip_failed_attempts[ip]
+    for key in list(ip_failed_attempts.keys()):
+        if key not in ip_requests or not ip_requests[key]:
+            del ip_failed_attempts[key]
 
-    for ip in list(blocked_ips.keys()):
-        if blocked_ips[ip] < now:
-            del blocked_ips[ip]
-            log.info(f"Unblocked IP: {ip}")
+    for network in blocked_ranges.expire(now):
+        log.info(f"Unblocked range: {network}")
 
     global global_requests, monthly_requests
     global_requests = [t for t in global_requests if t > day_ago]
@@ -94,8 +297,10 @@ def cleanup_old_requests():
 def check_rate_limit(ip):
     cleanup_old_requests()
 
-    if ip in blocked_ips:
-        remaining = int(blocked_ips[ip] - time.time())
+    address = parse_ip(ip)
+    blocked = blocked_ranges.lookup(address) if address is not None else None
+    if blocked:
+        remaining = int(blocked[1] - time.time())
         return False, f"IP temporarily blocked. Try again in {remaining // 60} minutes"
 
     now = time.time()
@@ -111,16 +316,17 @@ def check_rate_limit(ip):
         log.critical("DAILY LIMIT REACHED - SERVICE SUSPENDED")
         return False, "Service temporarily unavailable (daily limit)"
 
-    # per IP limits
-    ip_times = ip_requests[ip]
-    requests_last_hour = len([t for t in ip_times if t > hour_ago])
-    requests_last_day = len([t for t in ip_times if t > day_ago])
+    # per network limits
+    for key, per_hour, per_day, _ in get_ip_keys(ip):
+        ip_times = ip_requests.get(key, [])
+        requests_last_hour = len([t for t in ip_times if t > hour_ago])
+        requests_last_day = len([t for t in ip_times if t > day_ago])
 
-    if requests_last_hour >= MAX_REQUESTS_PER_IP_PER_HOUR:
-        return False, f"Rate limit: max {MAX_REQUESTS_PER_IP_PER_HOUR} requests/hour"
+        if requests_last_hour >= per_hour:
+            return False, f"Rate limit: max {per_hour} requests/hour"
 
-    if requests_last_day >= MAX_REQUESTS_PER_IP_PER_DAY:
-        return False, f"Rate limit: max {MAX_REQUESTS_PER_IP_PER_DAY} requests/day"
+        if requests_last_day >= per_day:
+            return False, f"Rate limit: max {per_day} requests/day"
 
     global_last_hour = len([t for t in global_requests if t > hour_ago])
 
@@ -135,17 +341,29 @@ def check_rate_limit(ip):
 
 def record_request(ip):
     now = time.time()
-    ip_requests[ip].append(now)
+    for key, _, _, _ in get_ip_keys(ip):
+        ip_requests[key].append(now)
     global_requests.append(now)
     monthly_requests.append(now)
 
 
 def record_failed_attempt(ip):
-    ip_failed_attempts[ip] += 1
-    if ip_failed_attempts[ip] >= FAILED_ATTEMPTS_BLOCK_THRESHOLD:
-        blocked_ips[ip] = time.time() + BLOCK_DURATION
-        log.warning(f"Blocked IP {ip} for {BLOCK_DURATION}s due to {ip_failed_attempts[ip]} failed attempts")
-        ip_failed_attempts[ip] = 0
+    for key, _, _, max_failed in get_ip_keys(ip):
+        ip_failed_attempts[key] += 1
+        if ip_failed_attempts[key] >= max_failed:
+            try:
+                blocked_ranges.add(ipaddress.ip_network(key), time.time() + BLOCK_DURATION)
+            except ValueError:
+                log.error(f"Cannot block unparsable address {key}")
+                continue
+            log.warning(f"Blocked range {key} for {BLOCK_DURATION}s due to {ip_failed_attempts[key]} failed attempts")
+            ip_failed_attempts[key] = 0
+
+
+def reset_failed_attempts(ip):
+    # only the client's own network, wider ranges keep counting
+    key = get_ip_keys(ip)[0][0]
+    ip_failed_attempts.pop(key, None)
 
 
 def generate_challenge():
@@ -194,7 +412,20 @@ def validate_app_password(password):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    global index_page
+    if index_page is None:
+        index_page = build_asset(render_template('index.html').encode('utf-8'), 'text/html; charset=utf-8')
+    # always revalidate, so a redeploy with new asset urls is picked up
+    return send_asset(index_page, 'no-cache')
+
+
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    if filename in hashed_assets:
+        return send_asset(hashed_assets[filename], f'public, max-age={HASHED_MAX_AGE}, immutable')
+    if filename in static_assets:
+        return send_asset(static_assets[filename], f'public, max-age={UNHASHED_MAX_AGE}')
+    abort(404)
 
 
 @app.route('/health')
@@ -264,7 +495,7 @@ def get_token():
         if 'Token' in res:
             log.info(f"Token generated successfully for {ip}")
             # reset failed attempts on success
-            ip_failed_attempts[ip] = 0
+            reset_failed_attempts(ip)
             return jsonify({
                 'success': True,
                 'master_token': res['Token']
@@ -312,10 +543,13 @@ def stats():
         'requests_last_hour': len([t for t in global_requests if t > hour_ago]),
         'requests_last_day': len(global_requests),
         'requests_this_month': len(monthly_requests),
-        'unique_ips_today': len(ip_requests),
-        'blocked_ips': len(blocked_ips),
+        # every v6 client is counted under both /64 and /48
+        'unique_ranges_today_by_prefix': count_by_prefix(ip_requests),
+        'blocked_ranges': len(blocked_ranges),
+        'blocked_ranges_by_prefix': blocked_ranges.count_by_prefix(),
         'active_challenges': len(challenges),
         'used_challenges': len(used_challenges),
+        'log_records_dropped': log_handler.dropped,
         'limits': {
             'daily_remaining': ABSOLUTE_DAILY_LIMIT - len(global_requests),
             'monthly_remaining': ABSOLUTE_MONTHLY_LIMIT - len(monthly_requests)